@@ -1,5 +1,10 @@
 import json
+import os
 
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+
+import dask.array as da
 import datashader as ds
 import numpy as np
 
@@ -16,11 +21,15 @@ from mapshader.sources import MapSource
 
 
 import spatialpandas
+import spatialpandas.dask
 
 
 tile_def = MercatorTileDefinition(x_range=(-20037508.34, 20037508.34),
                                   y_range=(-20037508.34, 20037508.34))
 
+# tile extents depend only on (x, y, z) and clients revisit the same tiles
+get_tile_meters = lru_cache(maxsize=65536)(tile_def.get_tile_meters)
+
 
 def create_agg(source: MapSource,
                xmin: float = None, ymin: float = None,
@@ -30,14 +39,13 @@ def create_agg(source: MapSource,
                height: int = 256, width: int = 256):
 
     if x is not None and y is not None and z is not None:
-        xmin, ymin, xmax, ymax = tile_def.get_tile_meters(x, y, z)
+        xmin, ymin, xmax, ymax = get_tile_meters(x, y, z)
     elif xmin is None or xmax is None or ymin is None or ymax is None:
         raise ValueError('extent must be provided to create_agg()')
 
     xfield = source.xfield
     yfield = source.yfield
-    zfield = source.zfield
-    agg_func = source.agg_func
+    reducer = source.reducer
     dataset = source.df
     geometry_type = source.geometry_type
 
@@ -45,66 +53,108 @@ def create_agg(source: MapSource,
                     x_range=(xmin, xmax), y_range=(ymin, ymax))
 
     if geometry_type == 'point':
-        return point_aggregation(cvs, dataset, xfield, yfield, zfield, agg_func)
+        return point_aggregation(cvs, dataset, xfield, yfield, reducer)
 
     elif geometry_type == 'line':
-        return line_aggregation(cvs, dataset, xfield, yfield, zfield, agg_func)
+        return line_aggregation(cvs, dataset, xfield, yfield, reducer)
 
     elif geometry_type == 'polygon':
-        return polygon_aggregation(cvs, dataset, zfield, agg_func)
+        return polygon_aggregation(cvs, dataset, reducer)
 
     elif geometry_type == 'raster':
-        return raster_aggregation(cvs, dataset, agg_func)
+        return raster_aggregation(cvs, dataset, source.raster_agg_func,
+                                  coords=source.get_raster_coords())
 
     else:
         raise ValueError('Unkown geometry type for {}'.format(dataset['name']))
 
 
-def point_aggregation(cvs, df, xfield, yfield, zfield, agg_func):
-    if zfield:
-        return cvs.points(df, xfield, yfield, getattr(ds, agg_func)(zfield))
+def point_aggregation(cvs, df, xfield, yfield, reducer):
+    if reducer is not None:
+        return cvs.points(df, xfield, yfield, reducer)
     else:
         return cvs.points(df, xfield, yfield)
 
 
-def line_aggregation(cvs, df, xfield, yfield, zfield, agg_func):
-    if zfield:
-        return cvs.line(df, xfield, yfield,
-                        agg=getattr(ds, agg_func)(zfield))
+def line_aggregation(cvs, df, xfield, yfield, reducer):
+    if reducer is not None:
+        return cvs.line(df, xfield, yfield, agg=reducer)
     else:
         return cvs.line(df, xfield, yfield)
 
 
-def polygon_aggregation(cvs, df, zfield, agg_func):
-    if zfield:
-        return cvs.polygons(df,
-                            'geometry',
-                            agg=getattr(ds, agg_func)(zfield))
+def polygon_aggregation(cvs, df, reducer):
+    if reducer is not None:
+        return cvs.polygons(df, 'geometry', agg=reducer)
     else:
         return cvs.polygons(df, 'geometry')
 
 
-def raster_aggregation(cvs, data, interpolate='linear', span=None, padding=4):
+def raster_aggregation(cvs, data, interpolate='linear', span=None, padding=4,
+                       coords=None):
     xmin, xmax = cvs.x_range
     ymin, ymax = cvs.y_range
-    xdrange = (xmax - xmin) * (1 + 2 * padding)
-    ydrange = (ymax - ymin) * (1 + 2 * padding)
+    xdrange = (xmax - xmin) * padding
+    ydrange = (ymax - ymin) * padding
     xsize = cvs.plot_width * (1 + 2 * padding)
     ysize = cvs.plot_height * (1 + 2 * padding)
+    new_xmin, new_xmax = xmin - xdrange, xmax + xdrange
+    new_ymin, new_ymax = ymin - ydrange, ymax + ydrange
     stcvs = ds.Canvas(plot_width=xsize,
                       plot_height=ysize,
-                      x_range=(xmin - xdrange, xmax + xdrange),
-                      y_range=(ymin - ydrange, ymax + ydrange))
+                      x_range=(new_xmin, new_xmax),
+                      y_range=(new_ymin, new_ymax))
+
+    if coords is None:
+        coords = (np.asarray(data.coords['x']), np.asarray(data.coords['y']))
+    xs, ys = coords
+
+    # slice lazily before loading so only the padded tile is materialized
+    data = data.isel(x=_coord_slice(xs, new_xmin, new_xmax),
+                     y=_coord_slice(ys, new_ymin, new_ymax))
+    if isinstance(data.data, da.Array):
+        data = data.compute()
+
     agg = stcvs.raster(data, interpolate=interpolate)
     return agg
 
 
+def _coord_slice(coords, start, end):
+    '''
+    Integer slice covering ``start <= coords <= end`` on sorted coords,
+    widened by one cell per side and at least two cells long so cells
+    straddling the window edges are kept and datashader can infer the
+    resolution even when the window is smaller than a cell.
+    '''
+    n = coords.size
+    if n > 1 and coords[0] > coords[-1]:
+        rev = coords[::-1]
+        i0 = n - np.searchsorted(rev, end, side='right')
+        i1 = n - np.searchsorted(rev, start, side='left')
+    else:
+        i0 = np.searchsorted(coords, start, side='left')
+        i1 = np.searchsorted(coords, end, side='right')
+
+    i0 = max(int(i0) - 1, 0)
+    i1 = min(int(i1) + 1, n)
+    if i1 - i0 < 2:
+        i0 = max(min(i0, n - 2), 0)
+        i1 = min(i0 + 2, n)
+    return slice(i0, i1)
+
+
 additional_transforms = {'hillshade': hillshade,
                          'quantile': quantile}
 
 def apply_additional_transforms(source: MapSource, agg: xr.DataArray):
-    agg = agg.astype('float64')
-    agg.data[agg.data == 0] = np.nan
+    # vector aggregates already leave empty pixels as nan / 0 count, so
+    # only rasters need the zero mask when there is nothing else to apply
+    if not source.extras and source.geometry_type != 'raster':
+        return source, agg
+
+    # single pass zero -> nan, kept in float32 to halve the bytes moved
+    data = agg.data.astype('float32', copy=False)
+    agg = agg.copy(data=np.where(data == 0, np.float32(np.nan), data))
     for e in source.extras:
         if e in additional_transforms:
             trans = additional_transforms.get(e)
@@ -117,37 +167,25 @@ def apply_additional_transforms(source: MapSource, agg: xr.DataArray):
 
 
 def shade_agg(source: MapSource, agg: xr.DataArray, xmin, ymin, xmax, ymax):
-    df = source.df
-    zfield = source.zfield
     geometry_type = source.geometry_type
     how = source.shade_how
     cmap = source.cmap
     span = source.span
 
     if isinstance(cmap, dict):
-        return tf.shade(agg, color_key=cmap)
+        img = tf.shade(agg, color_key=cmap)
+    elif span and span == 'min/max':
+        img = tf.shade(agg, cmap=cmap, how=how, span=source.get_span())
+    elif isinstance(span, tuple):
+        img = tf.shade(agg, cmap=cmap, how=how, span=span)
     else:
-        if span and span == 'min/max' and geometry_type == 'raster':
+        img = tf.shade(agg, cmap=cmap, how=how)
 
-            # TODO: don't need to calculate min each time...move into MapSource
-            print('Shade Raster with Span ({}, {})'.format(float(df.min().item()),
-                                                           float(df.max().item()) + 1))
-            img = tf.shade(agg, cmap=cmap,
-                           how=how, span=(int(df.min(skipna=True).item()),
-                                          int(df.max(skipna=True).item())+1))
+    if geometry_type == 'raster':
+        # crop the padding back off; datashader y coords are ascending
+        img = img.loc[{'x': slice(xmin, xmax), 'y': slice(ymin, ymax)}]
 
-            # TODO: don't do this unless we need to...check source.padding
-            return img.loc[{'x': slice(xmin, xmax), 'y': slice(ymax, ymin)}]
-
-        elif span and span == 'min/max':
-            print('Shade with Span')
-            return tf.shade(agg, cmap=cmap, how=how, span=(np.nanmin(df[zfield]),
-                                                           np.nanmax(df[zfield])))
-        elif isinstance(span, tuple):
-            return tf.shade(agg, cmap=cmap, how=how, span=span)
-        else:
-            print('Shade without Span')
-            return tf.shade(agg, cmap=cmap, how=how)
+    return img
 
 
 def render_map(source: MapSource,
@@ -157,19 +195,63 @@ def render_map(source: MapSource,
                z: float = None,
                height: int = 256, width: int = 256):
 
-    agg = create_agg(source, xmin, ymin, xmax, ymax, x, y, z, height, width)
+    if x is not None and y is not None and z is not None:
+        xmin, ymin, xmax, ymax = get_tile_meters(x, y, z)
+
+    if (None not in (xmin, ymin, xmax, ymax) and
+            not source.intersects(xmin, ymin, xmax, ymax)):
+        return blank_image(xmin, ymin, xmax, ymax, height, width)
+
+    agg = create_agg(source, xmin, ymin, xmax, ymax,
+                     height=height, width=width)
     source, agg = apply_additional_transforms(source, agg)
     img = shade_agg(source, agg, xmin, ymin, xmax, ymax)
 
-    # apply dynamic spreading ----------
-    if source.dynspread and source.dynspread > 0:
+    # apply dynamic spreading (blank tiles have nothing to spread) ----------
+    if source.dynspread and source.dynspread > 0 and img.data.any():
         img = tf.dynspread(img, threshold=1, max_px=int(source.dynspread))
 
     return img
 
 
+def blank_image(xmin, ymin, xmax, ymax, height, width):
+    '''
+    Fully transparent image covering the given extent.
+    '''
+    xstep = (xmax - xmin) / width
+    ystep = (ymax - ymin) / height
+    xs = np.linspace(xmin + xstep / 2, xmax - xstep / 2, width)
+    ys = np.linspace(ymin + ystep / 2, ymax - ystep / 2, height)
+    return tf.Image(_blank_buffer(height, width),
+                    coords=dict(x=xs, y=ys), dims=['y', 'x'])
+
+
+@lru_cache(maxsize=8)
+def _blank_buffer(height, width):
+    # shared between blank images of the same size, so keep it read-only
+    buf = np.zeros((height, width), dtype=np.uint32)
+    buf.flags.writeable = False
+    return buf
+
+
+def render_tiles(source: MapSource, coords, height: int = 256, width: int = 256,
+                 max_workers: int = None):
+    '''
+    Render a batch of (x, y, z) tiles on a thread pool, in input order.
+    Datashader's numba kernels release the GIL, so aggregation overlaps.
+    '''
+    def render(xyz):
+        x, y, z = xyz
+        return render_map(source, x=x, y=y, z=z, height=height, width=width)
+
+    with ThreadPoolExecutor(max_workers=max_workers or os.cpu_count()) as ex:
+        return list(ex.map(render, coords))
+
+
 def render_geojson(source: MapSource):
-    if isinstance(source.df, spatialpandas.GeoDataFrame):
+    if isinstance(source.df, spatialpandas.dask.DaskGeoDataFrame):
+        return source.df.compute().to_geopandas().to_json()
+    elif isinstance(source.df, spatialpandas.GeoDataFrame):
         return source.df.to_geopandas().to_json()
     else:
         # TODO: add proper line geojson (core.render_geojson)
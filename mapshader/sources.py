@@ -1,14 +1,18 @@
 from os import path
 
+import dask
+import datashader as ds
 import geopandas as gpd
+import numpy as np
 import pandas as pd
 import spatialpandas
-import datashader as ds
+import spatialpandas.dask
 
 from mapshader.colors import colors
 from mapshader.io import load_raster
-from mapshader.transforms import reproject_raster
+from mapshader.transforms import prepare_raster
 from mapshader.transforms import reproject_vector
+from mapshader.transforms import to_spatialpandas
 
 
 class MapSource():
@@ -21,7 +25,8 @@ class MapSource():
                  shade_how='linear', cmap=colors['viridis'],
                  dynspread=None, extras=None):
 
-        if fields is None and isinstance(df, (pd.DataFrame, gpd.GeoDataFrame)):
+        if fields is None and isinstance(df, (pd.DataFrame, gpd.GeoDataFrame,
+                                              spatialpandas.dask.DaskGeoDataFrame)):
             fields = [dict(key=c, text=c, value=c) for c in df.columns if c != 'geometry']
 
         if extras is None:
@@ -49,6 +54,72 @@ class MapSource():
         self.dynspread = dynspread
         self.extras = extras
 
+        # resolve the datashader reducer once instead of on every tile
+        if agg_func and zfield and geometry_type != 'raster':
+            self.reducer = getattr(ds, agg_func)(zfield)
+        else:
+            self.reducer = None
+
+        self._span_cache = None
+        self._coords_cache = None
+        self._bounds_cache = None
+
+    def get_span(self):
+        '''
+        Return the (min, max) span of a raster or of the zfield of a vector
+        source, computed once and cached.
+        '''
+        if self._span_cache is None:
+            if self.geometry_type == 'raster':
+                self._span_cache = (float(self.df.min(skipna=True).item()),
+                                    float(self.df.max(skipna=True).item()) + 1)
+            else:
+                zs = self.df[self.zfield]
+                zmin, zmax = zs.min(), zs.max()
+                if isinstance(self.df, spatialpandas.dask.DaskGeoDataFrame):
+                    zmin, zmax = dask.compute(zmin, zmax)
+                self._span_cache = (float(zmin), float(zmax))
+        return self._span_cache
+
+    def get_raster_coords(self):
+        '''
+        Return the (x, y) coordinate arrays of a raster source, cached.
+        '''
+        if self._coords_cache is None:
+            self._coords_cache = (np.asarray(self.df.coords['x']),
+                                  np.asarray(self.df.coords['y']))
+        return self._coords_cache
+
+    def get_bounds(self):
+        '''
+        Return the (xmin, ymin, xmax, ymax) extent of the source, cached.
+        '''
+        if self._bounds_cache is None:
+            if self.geometry_type == 'raster':
+                xs, ys = self.get_raster_coords()
+                xres = abs(xs[-1] - xs[0]) / max(len(xs) - 1, 1)
+                yres = abs(ys[-1] - ys[0]) / max(len(ys) - 1, 1)
+                bounds = (xs.min() - xres / 2, ys.min() - yres / 2,
+                          xs.max() + xres / 2, ys.max() + yres / 2)
+            elif isinstance(self.df, spatialpandas.dask.DaskGeoDataFrame):
+                bounds = self.df.geometry.total_bounds
+            elif isinstance(self.df, spatialpandas.GeoDataFrame):
+                bounds = self.df.geometry.array.total_bounds
+            else:
+                xs = self.df[self.xfield]
+                ys = self.df[self.yfield]
+                bounds = (xs.min(), ys.min(), xs.max(), ys.max())
+            self._bounds_cache = tuple(float(b) for b in bounds)
+        return self._bounds_cache
+
+    def intersects(self, xmin, ymin, xmax, ymax):
+        '''
+        Return False when the extent cannot contain any of the source data.
+        '''
+        bxmin, bymin, bxmax, bymax = self.get_bounds()
+        return not (xmax < bxmin or xmin > bxmax or
+                    ymax < bymin or ymin > bymax)
+
     @property
     def tile_url(self):
         url = (f'/{self.key}'
@@ -94,7 +165,7 @@ def world_countries_source():
     world = gpd.read_file(data)
     world = world[(world.name != "Antarctica") & (world.name != "Fr. S. Antarctic Lands")]
     world = reproject_vector(world)
-    spgdf = spatialpandas.GeoDataFrame(world, geometry='geometry')
+    spgdf = to_spatialpandas(world)
     return MapSource(name='World Countries',
                      geometry_type='polygon',
                      df=spgdf,
@@ -111,7 +182,7 @@ def world_countries_source():
 
 def world_boundaries_source():
 
-    from mapshader.transforms import line_geoseries_to_datashader_line
+    from mapshader.transforms import polygon_geoseries_to_datashader_line
 
     data = gpd.datasets.get_path('naturalearth_lowres')
     world = gpd.read_file(data)
@@ -119,12 +190,7 @@ def world_boundaries_source():
     world = reproject_vector(world)
 
     # convert polys to datashader compatible lines
-    world['geometry'] = world['geometry'].exterior
-
-    line_df = line_geoseries_to_datashader_line(world['geometry'])
-
-    if not len(world) == len(line_df):
-        print('WARNING: dropping records during line conversion')
+    line_df = polygon_geoseries_to_datashader_line(world['geometry'])
 
     return MapSource(name='World Boundaries',
                      geometry_type='line',
@@ -143,9 +209,9 @@ def world_cities_source():
     data = gpd.datasets.get_path('naturalearth_cities')
     gdf = gpd.read_file(data)
     gdf = reproject_vector(gdf)
-    gdf['X'] = gdf.geometry.apply(lambda p: p.x)
-    gdf['Y'] = gdf.geometry.apply(lambda p: p.y)
-    spgdf = spatialpandas.GeoDataFrame(gdf, geometry='geometry')
+    gdf['X'] = gdf.geometry.x
+    gdf['Y'] = gdf.geometry.y
+    spgdf = to_spatialpandas(gdf)
     return MapSource(name='World Cities',
                      geometry_type='point',
                      cmap=['black', 'black'],
@@ -162,7 +228,7 @@ def nybb_source():
     data = gpd.datasets.get_path('nybb')
     gdf = gpd.read_file(data)
     gdf = reproject_vector(gdf)
-    spgdf = spatialpandas.GeoDataFrame(gdf, geometry='geometry')
+    spgdf = to_spatialpandas(gdf)
     return MapSource(name='NYC Admin',
                      df=spgdf,
                      xfield='geometry',
@@ -182,11 +248,7 @@ def elevation_source():
     FIXTURES_DIR = path.join(HERE, 'tests', 'fixtures')
     elevation_path = path.join(FIXTURES_DIR, 'elevation.tif')
     arr = load_raster(elevation_path)
-    arr = arr.squeeze().drop("band")
-    arr.data = arr.data.astype('f8')
-    arr.data = ds.utils.orient_array(arr)
-    arr = arr.assign_coords(y=list(reversed(arr.coords['y'])))
-    arr = reproject_raster(arr)
+    arr = prepare_raster(arr)
     return MapSource(name='Elevation',
                      df=arr,
                      xfield='geometry',
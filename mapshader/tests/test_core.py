@@ -5,15 +5,24 @@ from io import BytesIO
 
 import pytest
 
+import geopandas as gpd
+import numpy as np
 import xarray as xr
 
 from datashader.transfer_functions import Image
+from spatialpandas.dask import DaskGeoDataFrame
 
 from mapshader.sources import MapSource
+from mapshader.core import create_agg
 from mapshader.core import render_map
 from mapshader.core import render_geojson
+from mapshader.core import render_tiles
+from mapshader.core import _coord_slice
 
 from mapshader.sources import get_user_datasets
+from mapshader.sources import elevation_source
+from mapshader.transforms import reproject_vector
+from mapshader.transforms import to_spatialpandas
 
 from mapshader.tests.data import DEFAULT_SOURCES_FUNCS
 
@@ -45,3 +54,117 @@ def test_default_to_tile(source_func):
     source = source_func()
     img = render_map(source, x=0, y=0, z=0)
     assert isinstance(img, Image)
+
+
+@pytest.mark.parametrize("descending", [False, True])
+def test_coord_slice(descending):
+    coords = np.arange(10, dtype='f8')
+    if descending:
+        coords = coords[::-1]
+    sliced = coords[_coord_slice(coords, 2.5, 6)]
+    assert sorted(sliced.tolist()) == [2, 3, 4, 5, 6, 7]
+
+    # windows narrower than a cell still bracket it with two cells
+    sliced = coords[_coord_slice(coords, 4.2, 4.4)]
+    assert sorted(sliced.tolist()) == [4, 5]
+
+    # windows past the edge are clamped to the last two cells
+    sliced = coords[_coord_slice(coords, 20, 30)]
+    assert sorted(sliced.tolist()) == [8, 9]
+
+
+@pytest.mark.parametrize("x, y, z", [(853, 1555, 12), (1706, 3110, 13)])
+def test_high_zoom_raster_tile(x, y, z):
+    # elevation cells are ~74km wide, larger than the padded z12+ window
+    source = elevation_source()
+    agg = create_agg(source, x=x, y=y, z=z)
+    center = agg.data[4 * 256:5 * 256, 4 * 256:5 * 256]
+    assert np.isfinite(center).all()
+
+
+@pytest.mark.parametrize("source_func", DEFAULT_SOURCES_FUNCS)
+def test_default_to_tiles(source_func):
+    source = source_func()
+    coords = [(0, 0, 1), (1, 0, 1), (0, 1, 1), (1, 1, 1)]
+    imgs = render_tiles(source, coords)
+    assert len(imgs) == len(coords)
+    assert all(isinstance(img, Image) for img in imgs)
+
+
+@pytest.mark.parametrize("source_func", DEFAULT_SOURCES_FUNCS)
+def test_empty_tile_is_blank(source_func):
+    source = source_func()
+    xmin, ymin, xmax, ymax = source.get_bounds()
+    width = xmax - xmin
+    img = render_map(source, xmin=xmax + width, ymin=ymin,
+                     xmax=xmax + 2 * width, ymax=ymax,
+                     width=64, height=32)
+    assert isinstance(img, Image)
+    assert img.shape == (32, 64)
+    assert not img.data.any()
+
+
+@pytest.mark.parametrize("x, y, z", [(0, 0, 0), (853, 1555, 12)])
+def test_raster_tile_is_cropped(x, y, z):
+    source = elevation_source()
+    img = render_map(source, x=x, y=y, z=z, height=256, width=256)
+    assert isinstance(img, Image)
+    assert img.shape == (256, 256)
+    assert img.data.any()
+
+
+@pytest.mark.parametrize("span", [None, (0, 1000)])
+def test_raster_tile_is_cropped_without_minmax_span(span):
+    source = MapSource(name='Elevation',
+                       df=elevation_source().df,
+                       geometry_type='raster',
+                       span=span,
+                       key='elevation-no-span')
+    img = render_map(source, x=0, y=0, z=0, height=256, width=256)
+    assert isinstance(img, Image)
+    assert img.shape == (256, 256)
+
+
+def test_blank_image_is_cached():
+    source = elevation_source()
+    xmin, ymin, xmax, ymax = source.get_bounds()
+    width = xmax - xmin
+    first = render_map(source, xmin=xmax + width, ymin=ymin,
+                       xmax=xmax + 2 * width, ymax=ymax)
+    second = render_map(source, xmin=xmax + 3 * width, ymin=ymin,
+                        xmax=xmax + 4 * width, ymax=ymax)
+    assert np.shares_memory(first.data, second.data)
+    assert first.coords['x'].values[0] != second.coords['x'].values[0]
+
+
+def test_packed_vector_source():
+    gdf = gpd.read_file(gpd.datasets.get_path('naturalearth_lowres'))
+    gdf = gdf[(gdf.name != "Antarctica") & (gdf.name != "Fr. S. Antarctic Lands")]
+    gdf = reproject_vector(gdf)
+    source = MapSource(name='Packed Countries',
+                       geometry_type='polygon',
+                       df=to_spatialpandas(gdf, partition_size=50),
+                       span='min/max',
+                       zfield='pop_est',
+                       agg_func='sum',
+                       key='packed-countries')
+    assert isinstance(source.df, DaskGeoDataFrame)
+    assert source.fields
+
+    # persisted: one in-memory task per partition, no shuffle left to rerun
+    graph_size = len(source.df.__dask_graph__())
+    assert graph_size == source.df.npartitions
+
+    assert source.get_span() == (float(gdf['pop_est'].min()),
+                                 float(gdf['pop_est'].max()))
+    np.testing.assert_allclose(source.get_bounds(), gdf.total_bounds)
+
+    img = render_map(source, x=0, y=0, z=0)
+    assert isinstance(img, Image)
+    assert img.data.any()
+    render_map(source, x=1, y=1, z=1)
+    assert len(source.df.__dask_graph__()) == graph_size
+
+    data = json.loads(render_geojson(source))
+    assert data.get('type') == 'FeatureCollection'
+    assert len(data['features']) == len(gdf)
@@ -5,6 +5,8 @@ from io import BytesIO
 
 import pytest
 
+import datashader as ds
+
 from PIL import Image
 
 from mapshader.sources import MapSource
@@ -34,3 +36,18 @@ def test_load_default_dataset(source_func):
 def test_get_user_datasets():
     user_datasets = get_user_datasets()
     assert isinstance(user_datasets, dict)
+
+
+def test_raster_span_is_cached():
+    source = elevation_source()
+    span = source.get_span()
+    assert span[0] == float(source.df.min(skipna=True).item())
+    assert span[1] == float(source.df.max(skipna=True).item()) + 1
+    assert source.get_span() is span
+
+
+def test_reducer_is_resolved_once():
+    source = world_countries_source()
+    assert isinstance(source.reducer, ds.sum)
+    assert source.reducer.column == 'pop_est'
+    assert world_cities_source().reducer is None
@@ -1,3 +1,4 @@
+import datetime
 import json
 from os import path
 
@@ -5,8 +6,16 @@ from io import BytesIO
 
 import pytest
 
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+import spatialpandas
 import xarray as xr
 
+from shapely.geometry import LineString, MultiLineString
+from shapely.geometry import Polygon, MultiPolygon
+from spatialpandas.dask import DaskGeoDataFrame
+
 from datashader.transfer_functions import Image
 
 from mapshader.sources import MapSource
@@ -16,6 +25,60 @@ from mapshader.core import render_geojson
 from mapshader.sources import get_user_datasets
 from mapshader.sources import elevation_source
 
+from mapshader.transforms import line_geoseries_to_datashader_line
+from mapshader.transforms import polygon_geoseries_to_datashader_line
+from mapshader.transforms import to_spatialpandas
+
 from mapshader.tests.data import DEFAULT_SOURCES_FUNCS
 
-# TODO: add transform tests (test_transforms.py)
+
+def test_line_geoseries_to_datashader_line():
+    series = gpd.GeoSeries([LineString([(0, 0), (1, 1)]),
+                            MultiLineString([[(2, 2), (3, 3)], [(4, 4), (5, 5)]])])
+    df = line_geoseries_to_datashader_line(series)
+    expected_x = [0, 1, np.nan, 2, 3, np.nan, 4, 5, np.nan]
+    np.testing.assert_array_equal(df['x'].values, expected_x)
+    np.testing.assert_array_equal(df['y'].values, expected_x)
+
+
+def test_polygon_geoseries_to_datashader_line():
+    square = [(0, 0), (1, 0), (1, 1), (0, 1)]
+    hole = [(0.2, 0.2), (0.4, 0.2), (0.4, 0.4)]
+    series = gpd.GeoSeries([Polygon(square, [hole]),
+                            MultiPolygon([Polygon([(2, 2), (3, 2), (3, 3)]),
+                                          Polygon([(4, 4), (5, 4), (5, 5)])])])
+    df = polygon_geoseries_to_datashader_line(series)
+
+    # one nan-terminated exterior ring per polygon part, holes dropped
+    assert len(df) == (5 + 1) + (4 + 1) + (4 + 1)
+    assert df['x'].isnull().sum() == 3
+    assert np.isnan(df['x'].values[-1])
+    assert not np.isin(df['x'].values, [0.2, 0.4]).any()
+
+
+def test_to_spatialpandas_packs_large_frames():
+    gdf = gpd.read_file(gpd.datasets.get_path('naturalearth_lowres'))
+    assert isinstance(to_spatialpandas(gdf), spatialpandas.GeoDataFrame)
+
+    packed = to_spatialpandas(gdf, partition_size=50)
+    assert isinstance(packed, DaskGeoDataFrame)
+    assert packed.npartitions == len(gdf) // 50
+    assert len(packed.compute()) == len(gdf)
+
+
+def test_to_spatialpandas_arrow_strings():
+    gdf = gpd.read_file(gpd.datasets.get_path('naturalearth_lowres'))
+    spgdf = to_spatialpandas(gdf)
+    assert isinstance(spgdf['name'].dtype, pd.ArrowDtype)
+    assert not isinstance(spgdf['pop_est'].dtype, pd.ArrowDtype)
+    assert spgdf['name'].tolist() == gdf['name'].tolist()
+
+
+def test_to_spatialpandas_keeps_non_string_objects():
+    gdf = gpd.read_file(gpd.datasets.get_path('naturalearth_lowres'))
+    gdf['updated'] = datetime.date(2020, 1, 1)
+    gdf['mixed'] = [i if i % 2 else str(i) for i in range(len(gdf))]
+    spgdf = to_spatialpandas(gdf)
+    assert isinstance(spgdf['name'].dtype, pd.ArrowDtype)
+    assert spgdf['updated'].dtype == object
+    assert spgdf['mixed'].dtype == object
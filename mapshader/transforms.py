@@ -2,7 +2,15 @@ import rioxarray  # NOQA
 import xarray as xr
 import numpy as np
 import pandas as pd
+import pyarrow as pa
 import geopandas as gpd
+import shapely
+import spatialpandas
+import spatialpandas.dask  # NOQA
+import dask.dataframe as dd
+
+from numba import njit, prange
+from spatialpandas.geometry import MultiPolygonArray
 
 wb_proj_str = '+proj=merc +a=6378137 +b=6378137 +lat_ts=0.0 +lon_0=0.0 +x_0=0.0 +y_0=0 +k=1.0 +units=m +nadgrids=@null +wktext +no_defs'
 
@@ -16,23 +24,80 @@ def reproject_raster(arr: xr.DataArray, epsg=3857):
     pass
 
 
+def prepare_raster(arr: xr.DataArray, dtype='f8', epsg=3857):
+    # squeeze, cast, flip north-up rows to ascending y and reproject as one
+    # functional chain so dask-backed rasters stay lazy until reprojection
+    arr = arr.squeeze('band', drop=True).astype(dtype, copy=False)
+    arr = arr.isel(y=slice(None, None, -1))
+    return reproject_raster(arr, epsg=epsg)
+
+
 def reproject_vector(gdf: gpd.GeoDataFrame, epsg=3857):
     return gdf.to_crs(epsg=epsg)
 
 
+def to_spatialpandas(gdf: gpd.GeoDataFrame, geometry_field='geometry',
+                     partition_size=50000):
+    # string attributes go to arrow so they are stored contiguously and
+    # filtered with arrow kernels; numeric columns stay numpy for numba
+    string_columns = [c for c in gdf.columns
+                      if c != geometry_field and gdf[c].dtype == object and
+                      pd.api.types.infer_dtype(gdf[c], skipna=True) == 'string']
+    gdf = gdf.astype({c: pd.ArrowDtype(pa.string()) for c in string_columns})
+
+    spgdf = spatialpandas.GeoDataFrame(gdf, geometry=geometry_field)
+
+    # large frames are hilbert-packed so datashader can skip partitions
+    # whose bounds miss the tile, and persisted so the packing shuffle runs
+    # once rather than per tile; small ones stay a single in-memory frame
+    npartitions = len(spgdf) // partition_size
+    if npartitions > 1:
+        spgdf = dd.from_pandas(spgdf, npartitions=npartitions)
+        spgdf = spgdf.pack_partitions(npartitions=npartitions).persist()
+    return spgdf
+
+
 def line_geoseries_to_datashader_line(series: gpd.GeoSeries):
-    # TODO: This is slow! Make this faster!
-    xs = []
-    ys = []
-    for s in series.values:
-        try:
-            coords = s.coords.xy
-            xs += coords[0].tolist()
-            ys += coords[1].tolist()
-
-            xs.append(np.nan)
-            ys.append(np.nan)
-        except:
-            continue
+    # explode multi-part geometries so each line gets its own nan separator
+    parts = shapely.get_parts(series.values)
+    coords, index = shapely.get_coordinates(parts, return_index=True)
+
+    if not len(coords):
+        return pd.DataFrame(dict(x=[], y=[]), dtype='f8')
+
+    breaks = np.flatnonzero(np.diff(index)) + 1
+    coords = np.insert(coords, breaks, np.nan, axis=0)
+    coords = np.append(coords, [[np.nan, np.nan]], axis=0)
+
+    return pd.DataFrame(dict(x=coords[:, 0], y=coords[:, 1]))
+
+
+def polygon_geoseries_to_datashader_line(series: gpd.GeoSeries):
+    # exterior ring of every polygon part, straight from spatialpandas buffers
+    polygons = MultiPolygonArray.from_geopandas(series.array)
+    values = polygons.buffer_values
+    ring_offsets = polygons.buffer_offsets[-2]
+    value_offsets = polygons.buffer_offsets[-1]
+
+    starts = value_offsets[ring_offsets[:-1]]
+    stops = value_offsets[ring_offsets[:-1] + 1]
+    out_offsets = np.zeros(len(starts) + 1, dtype=np.int64)
+    np.cumsum((stops - starts) // 2 + 1, out=out_offsets[1:])
+
+    xs = np.empty(out_offsets[-1], dtype='f8')
+    ys = np.empty(out_offsets[-1], dtype='f8')
+    _exterior_rings_to_line(values, starts, stops, out_offsets, xs, ys)
 
     return pd.DataFrame(dict(x=xs, y=ys))
+
+
+@njit(parallel=True, nogil=True, cache=True)
+def _exterior_rings_to_line(values, starts, stops, out_offsets, xs, ys):
+    for i in prange(len(starts)):
+        k = out_offsets[i]
+        for j in range(starts[i], stops[i], 2):
+            xs[k] = values[j]
+            ys[k] = values[j + 1]
+            k += 1
+        xs[k] = np.nan
+        ys[k] = np.nan
@@ -12,6 +12,10 @@ setup(name='mapshader',
       install_requires=['xarray-spatial',
                         'datashader',
                         'geopandas',
+                        'shapely>=2.0',
+                        'pandas>=1.5',
+                        'dask',
+                        'numba',
                         'spatialpandas',
                         'pytest',
                         'tbb',